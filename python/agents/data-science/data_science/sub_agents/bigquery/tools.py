@@ -14,11 +14,19 @@
 
 """This file contains the tools used by the database agent."""
 
+import base64
 import datetime
+import decimal
+import functools
+import itertools
 import logging
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
 from data_science.utils.utils import get_env_var
 from google.adk.tools import ToolContext
 from google.cloud import bigquery
@@ -34,16 +42,67 @@ llm_client = Client(vertexai=True, project=project, location=location)
 
 MAX_NUM_ROWS = 80
 
+# Statements that modify data or schema, which the agent must not run.
+_DML_DDL_KEYWORDS = frozenset(
+    {"update", "delete", "drop", "insert", "create", "alter", "truncate", "merge"}
+)
+_SQL_WORD_RE = re.compile(r"\w+")
+
+# Escape sequences left in LLM-generated SQL, and what they stand for.
+_SQL_ESCAPE_RE = re.compile(r"\\([\"'\n]|n)")
+_SQL_UNESCAPES = {'"': '"', "'": "'", "\n": "\n", "n": "\n"}
+_SQL_LIMIT_RE = re.compile(r"\blimit\b", re.IGNORECASE)
+
+# A markdown code fence with an optional language hint. The closing fence may
+# be missing if the response was cut off.
+_CODE_FENCE_RE = re.compile(
+    r"```(?:sql|bigquery)?(.*?)(?:```|\Z)", re.IGNORECASE | re.DOTALL
+)
+
+# Templates for the statements that describe each table to the model.
+_CREATE_TABLE_DDL_TEMPLATE = (
+    "CREATE OR REPLACE TABLE `{table_ref}` (\n{column_defs}\n);\n\n"
+)
+_INSERT_TEMPLATE = "INSERT INTO `{table_ref}` VALUES\n({values});\n\n"
+
+# Maximum number of concurrent BigQuery requests when retrieving the schema.
+_MAX_FETCH_WORKERS = 16
+
+# Table metadata and sample rows rarely change within a session, so they are
+# cached for a few minutes.
+_cache_lock = threading.RLock()
+_table_cache = TTLCache(maxsize=1024, ttl=300)
+_sample_rows_cache = TTLCache(maxsize=1024, ttl=300)
+
 
 database_settings = None
 bq_client = None
 
+# Guard the lazy initialization of the singletons above, so that concurrent
+# tool calls do not create several clients or retrieve the schema twice.
+_bq_client_lock = threading.Lock()
+_database_settings_lock = threading.Lock()
+
+
+@functools.cache
+def _get_env_var_once(var_name):
+    """Reads a required environment variable on first use and caches it.
+
+    The value is not read at import time, since `.env` may not be loaded yet.
+    A missing variable raises ValueError and is not cached.
+    """
+    return get_env_var(var_name)
+
 
 def get_bq_client():
     """Get BigQuery client."""
     global bq_client
     if bq_client is None:
-        bq_client = bigquery.Client(project=get_env_var("BQ_PROJECT_ID"))
+        with _bq_client_lock:
+            if bq_client is None:
+                bq_client = bigquery.Client(
+                    project=_get_env_var_once("BQ_PROJECT_ID")
+                )
     return bq_client
 
 
@@ -51,21 +110,24 @@ def get_database_settings():
     """Get database settings."""
     global database_settings
     if database_settings is None:
-        database_settings = update_database_settings()
+        with _database_settings_lock:
+            if database_settings is None:
+                database_settings = update_database_settings()
     return database_settings
 
 
 def update_database_settings():
-    """Update database settings."""
+    """Update database settings, retrieving the schema afresh."""
     global database_settings
+    clear_schema_caches()
     ddl_schema = get_bigquery_schema(
-        get_env_var("BQ_DATASET_ID"),
+        _get_env_var_once("BQ_DATASET_ID"),
         client=get_bq_client(),
-        project_id=get_env_var("BQ_PROJECT_ID"),
+        project_id=_get_env_var_once("BQ_PROJECT_ID"),
     )
     database_settings = {
-        "bq_project_id": get_env_var("BQ_PROJECT_ID"),
-        "bq_dataset_id": get_env_var("BQ_DATASET_ID"),
+        "bq_project_id": _get_env_var_once("BQ_PROJECT_ID"),
+        "bq_dataset_id": _get_env_var_once("BQ_DATASET_ID"),
         "bq_ddl_schema": ddl_schema,
         # Include ChaseSQL-specific constants.
         **chase_constants.chase_sql_constants_dict,
@@ -73,9 +135,175 @@ def update_database_settings():
     return database_settings
 
 
+# Characters that must be escaped inside a BigQuery string literal.
+_SQL_STRING_ESCAPES = str.maketrans(
+    {"\\": "\\\\", "'": "\\'", "\n": "\\n", "\r": "\\r"}
+)
+
+
+def _quote_sql_string(value):
+    """Quotes a string as a BigQuery string literal."""
+    return "'" + value.translate(_SQL_STRING_ESCAPES) + "'"
+
+
+def _serialize_temporal_for_sql(value):
+    """Serializes a date, time or timestamp into a BigQuery SQL literal."""
+    return _quote_sql_string(str(value))
+
+
+def _serialize_bytes_for_sql(value):
+    """Serializes bytes into a BigQuery SQL literal."""
+    return f"FROM_BASE64('{base64.b64encode(value).decode('ascii')}')"
+
+
+def _serialize_array_for_sql(value):
+    """Serializes a repeated value into a BigQuery array literal."""
+    return "[" + ", ".join(_serialize_value_for_sql(item) for item in value) + "]"
+
+
+def _serialize_struct_for_sql(value):
+    """Serializes a record value into a BigQuery struct literal."""
+    fields = ", ".join(
+        f"{_serialize_value_for_sql(item)} AS `{key}`" for key, item in value.items()
+    )
+    return f"STRUCT({fields})"
+
+
+# Serializers by exact value type, so that the common cases need a single
+# dictionary lookup rather than a chain of isinstance() checks.
+_SQL_SERIALIZERS = {
+    str: _quote_sql_string,
+    int: str,
+    float: str,
+    bool: str,
+    decimal.Decimal: str,
+    bytes: _serialize_bytes_for_sql,
+    datetime.datetime: _serialize_temporal_for_sql,
+    datetime.date: _serialize_temporal_for_sql,
+    datetime.time: _serialize_temporal_for_sql,
+    list: _serialize_array_for_sql,
+    dict: _serialize_struct_for_sql,
+}
+
+
+def _serialize_value_for_sql(value):
+    """Serializes a single sample value into a BigQuery SQL literal."""
+    if value is None:
+        return "NULL"
+    serializer = _SQL_SERIALIZERS.get(type(value))
+    if serializer is None:
+        # Subclasses of the types above, or types without a dedicated
+        # serializer.
+        serializer = next(
+            (
+                candidate
+                for value_type, candidate in _SQL_SERIALIZERS.items()
+                if isinstance(value, value_type)
+            ),
+            str,
+        )
+    return serializer(value)
+
+
+def _table_cache_key(client, table_ref):  # pylint: disable=unused-argument
+    """Builds a cache key for a table, ignoring the client instance."""
+    return hashkey(str(table_ref))
+
+
+@cached(_table_cache, key=_table_cache_key, lock=_cache_lock)
+def _get_table(client, table_ref):
+    """Fetches the metadata of a BigQuery table."""
+    return client.get_table(table_ref)
+
+
+def _sample_rows_cache_key(client, table_obj):  # pylint: disable=unused-argument
+    """Builds a cache key for a table's sample rows."""
+    return hashkey(str(table_obj.reference))
+
+
+@cached(_sample_rows_cache, key=_sample_rows_cache_key, lock=_cache_lock)
+def _get_sample_rows(client, table_obj):
+    """Fetches a few sample rows of a BigQuery table."""
+    return list(client.list_rows(table_obj, max_results=5))
+
+
+def clear_schema_caches():
+    """Clears the cached table metadata and sample rows."""
+    with _cache_lock:
+        _table_cache.clear()
+        _sample_rows_cache.clear()
+
+
+def _list_table_refs(client, dataset_ref):
+    """Lists the references of all tables and views in a dataset."""
+    return [
+        dataset_ref.table(table.table_id) for table in client.list_tables(dataset_ref)
+    ]
+
+
+def _get_table_sample_rows(client, table_obj):
+    """Fetches the sample rows of a table, or None if the table is empty."""
+    # Tables known to be empty have no sample rows to fetch. `num_rows` leaves
+    # out rows still in the streaming buffer, so tables filled by streaming
+    # inserts are sampled regardless.
+    if table_obj.num_rows == 0 and table_obj.streaming_buffer is None:
+        return None
+    return _get_sample_rows(client, table_obj)
+
+
+def _build_schema_ddl(tables, samples):
+    """Generates DDL statements with example values for the given tables.
+
+    Args:
+        tables (list[bigquery.Table]): The tables to describe.
+        samples (list[list[bigquery.Row] | None]): The sample rows of each table.
+
+    Returns:
+        str: A string containing the generated DDL statements.
+    """
+    ddl_parts: list[str] = []
+
+    for table_obj, rows in zip(tables, samples):
+        table_ref = table_obj.reference
+
+        column_defs = [
+            f"  `{field.name}` {field.field_type}"
+            + (" ARRAY" if field.mode == "REPEATED" else "")
+            + (
+                f" COMMENT {_quote_sql_string(field.description)}"
+                if field.description
+                else ""
+            )
+            for field in table_obj.schema
+        ]
+        ddl_parts.append(
+            _CREATE_TABLE_DDL_TEMPLATE.format(
+                table_ref=table_ref, column_defs=",\n".join(column_defs)
+            )
+        )
+
+        # Add example values if available (limited to first row)
+        if rows:
+            ddl_parts.append(f"-- Example values for table `{table_ref}`:\n")
+            ddl_parts.extend(
+                _INSERT_TEMPLATE.format(
+                    table_ref=table_ref,
+                    values=", ".join(
+                        _serialize_value_for_sql(value) for value in row.values()
+                    ),
+                )
+                for row in rows
+            )
+
+    return "".join(ddl_parts)
+
+
 def get_bigquery_schema(dataset_id, client=None, project_id=None):
     """Retrieves schema and generates DDL with example values for a BigQuery dataset.
 
+    The table metadata and sample rows the DDL is built from are cached for a
+    few minutes; call `clear_schema_caches` to fetch them again.
+
     Args:
         dataset_id (str): The ID of the BigQuery dataset (e.g., 'my_dataset').
         client (bigquery.Client): A BigQuery client.
@@ -91,68 +319,30 @@ def get_bigquery_schema(dataset_id, client=None, project_id=None):
     # dataset_ref = client.dataset(dataset_id)
     dataset_ref = bigquery.DatasetReference(project_id, dataset_id)
 
-    ddl_statements = ""
-
-    for table in client.list_tables(dataset_ref):
-        table_ref = dataset_ref.table(table.table_id)
-        table_obj = client.get_table(table_ref)
-
-        # Check if table is a view
-        if table_obj.table_type != "TABLE":
-            continue
-
-        ddl_statement = f"CREATE OR REPLACE TABLE `{table_ref}` (\n"
-
-        for field in table_obj.schema:
-            ddl_statement += f"  `{field.name}` {field.field_type}"
-            if field.mode == "REPEATED":
-                ddl_statement += " ARRAY"
-            if field.description:
-                ddl_statement += f" COMMENT '{field.description}'"
-            ddl_statement += ",\n"
+    table_refs = _list_table_refs(client, dataset_ref)
 
-        ddl_statement = ddl_statement[:-2] + "\n);\n\n"
+    # Fetch table metadata and sample rows concurrently instead of waiting for
+    # one roundtrip per table.
+    with ThreadPoolExecutor(max_workers=_MAX_FETCH_WORKERS) as executor:
+        table_objs = executor.map(
+            lambda table_ref: _get_table(client, table_ref), table_refs
+        )
 
-        # Add example values if available (limited to first row)
-        rows = client.list_rows(table_ref, max_results=5).to_dataframe()
-        if not rows.empty:
-            ddl_statement += f"-- Example values for table `{table_ref}`:\n"
-            for _, row in rows.iterrows():  # Iterate over DataFrame rows
-                ddl_statement += f"INSERT INTO `{table_ref}` VALUES\n"
-                example_row_str = "("
-                for value in row.values:  # Now row is a pandas Series and has values
-                    if isinstance(value, str):
-                        example_row_str += f"'{value}',"
-                    elif value is None:
-                        example_row_str += "NULL,"
-                    else:
-                        example_row_str += f"{value},"
-                example_row_str = (
-                    example_row_str[:-1] + ");\n\n"
-                )  # remove trailing comma
-                ddl_statement += example_row_str
-
-        ddl_statements += ddl_statement
-
-    return ddl_statements
+        # Skip views and other non-TABLE types
+        tables = [
+            table_obj for table_obj in table_objs if table_obj.table_type == "TABLE"
+        ]
 
+        samples = list(
+            executor.map(
+                lambda table_obj: _get_table_sample_rows(client, table_obj), tables
+            )
+        )
 
-def initial_bq_nl2sql(
-    question: str,
-    tool_context: ToolContext,
-) -> str:
-    """Generates an initial SQL query from a natural language question.
+    return _build_schema_ddl(tables, samples)
 
-    Args:
-        question (str): Natural language question.
-        tool_context (ToolContext): The tool context to use for generating the SQL
-          query.
 
-    Returns:
-        str: An SQL statement to answer this question.
-    """
-
-    prompt_template = """
+NL2SQL_PROMPT_TEMPLATE = """
 You are a BigQuery SQL expert tasked with answering user's questions about BigQuery tables by generating SQL queries in the GoogleSql dialect.  Your task is to write a Bigquery SQL query that answers the following question while using the provided context.
 
 **Guidelines:**
@@ -183,29 +373,94 @@ The database structure is defined by the following table schemas (possibly with
 
    """
 
+# MAX_NUM_ROWS is a constant and the schema rarely changes within a session,
+# so only the question has to be filled in for each request.
+_NL2SQL_PROMPT_HEAD, _NL2SQL_PROMPT_TAIL = NL2SQL_PROMPT_TEMPLATE.replace(
+    "{MAX_NUM_ROWS}", str(MAX_NUM_ROWS)
+).split("{QUESTION}")
+
+
+@functools.lru_cache(maxsize=4)
+def _nl2sql_prompt_parts(ddl_schema):
+    """Returns the NL2SQL prompt before and after the question."""
+    return _NL2SQL_PROMPT_HEAD.replace("{SCHEMA}", ddl_schema), _NL2SQL_PROMPT_TAIL
+
+
+def _build_nl2sql_prompt(ddl_schema, question):
+    """Fills the schema and the question into the NL2SQL prompt template."""
+    prefix, suffix = _nl2sql_prompt_parts(ddl_schema)
+    return prefix + question + suffix
+
+
+def _strip_code_fences(text):
+    """Returns the SQL inside the first code fence of a response, if any."""
+    match = _CODE_FENCE_RE.search(text)
+    if match:
+        text = match.group(1)
+    return text.strip()
+
+
+def initial_bq_nl2sql(
+    question: str,
+    tool_context: ToolContext,
+) -> str:
+    """Generates an initial SQL query from a natural language question.
+
+    Args:
+        question (str): Natural language question.
+        tool_context (ToolContext): The tool context to use for generating the SQL
+          query.
+
+    Returns:
+        str: An SQL statement to answer this question.
+    """
+
     ddl_schema = tool_context.state["database_settings"]["bq_ddl_schema"]
 
-    prompt = prompt_template.format(
-        MAX_NUM_ROWS=MAX_NUM_ROWS, SCHEMA=ddl_schema, QUESTION=question
-    )
+    prompt = _build_nl2sql_prompt(ddl_schema, question)
 
     response = llm_client.models.generate_content(
-        model=os.getenv("BASELINE_NL2SQL_MODEL"),
+        model=_get_env_var_once("BASELINE_NL2SQL_MODEL"),
         contents=prompt,
         config={"temperature": 0.1},
     )
 
     sql = response.text
     if sql:
-        sql = sql.replace("```sql", "").replace("```", "").strip()
+        sql = _strip_code_fences(sql)
 
-    print("\n sql:", sql)
+    logging.debug("Generated SQL: %s", sql)
 
     tool_context.state["sql_query"] = sql
 
     return sql
 
 
+def cleanup_sql(sql_string):
+    """Processes the SQL string to get a printable, valid SQL string."""
+
+    # 1. Unescape double quotes, single quotes, newlines and backslashes
+    #    before newlines, in a single pass over the string.
+    sql_string = _SQL_ESCAPE_RE.sub(
+        lambda match: _SQL_UNESCAPES[match.group(1)], sql_string
+    )
+
+    # 2. Add limit clause if not present
+    if not _SQL_LIMIT_RE.search(sql_string):
+        sql_string = sql_string + " limit " + str(MAX_NUM_ROWS)
+
+    return sql_string
+
+
+def _contains_dml_ddl(sql_string):
+    """Checks whether a SQL string contains any DML or DDL keyword.
+
+    Keywords are matched as whole words, case-insensitively, so identifiers
+    such as `created_at` do not count.
+    """
+    return not _DML_DDL_KEYWORDS.isdisjoint(_SQL_WORD_RE.findall(sql_string.lower()))
+
+
 def run_bigquery_validation(
     sql_string: str,
     tool_context: ToolContext,
@@ -239,27 +494,6 @@ def run_bigquery_validation(
                 message from BigQuery.
     """
 
-    def cleanup_sql(sql_string):
-        """Processes the SQL string to get a printable, valid SQL string."""
-
-        # 1. Remove backslashes escaping double quotes
-        sql_string = sql_string.replace('\\"', '"')
-
-        # 2. Remove backslashes before newlines (the key fix for this issue)
-        sql_string = sql_string.replace("\\\n", "\n")  # Corrected regex
-
-        # 3. Replace escaped single quotes
-        sql_string = sql_string.replace("\\'", "'")
-
-        # 4. Replace escaped newlines (those not preceded by a backslash)
-        sql_string = sql_string.replace("\\n", "\n")
-
-        # 5. Add limit clause if not present
-        if "limit" not in sql_string.lower():
-            sql_string = sql_string + " limit " + str(MAX_NUM_ROWS)
-
-        return sql_string
-
     logging.info("Validating SQL: %s", sql_string)
     sql_string = cleanup_sql(sql_string)
     logging.info("Validating SQL (after cleanup): %s", sql_string)
@@ -267,9 +501,7 @@ def run_bigquery_validation(
     final_result = {"query_result": None, "error_message": None}
 
     # More restrictive check for BigQuery - disallow DML and DDL
-    if re.search(
-        r"(?i)(update|delete|drop|insert|create|alter|truncate|merge)", sql_string
-    ):
+    if _contains_dml_ddl(sql_string):
         final_result["error_message"] = (
             "Invalid SQL: Contains disallowed DML/DDL operations."
         )
@@ -280,19 +512,19 @@ def run_bigquery_validation(
         results = query_job.result()  # Get the query results
 
         if results.schema:  # Check if query returned data
+            # Convert BigQuery RowIterator to list of dicts, stopping after
+            # MAX_NUM_ROWS so that further result pages are never fetched.
             rows = [
                 {
                     key: (
-                        value
-                        if not isinstance(value, datetime.date)
-                        else value.strftime("%Y-%m-%d")
+                        value.isoformat()
+                        if isinstance(value, datetime.date)
+                        else value
                     )
                     for (key, value) in row.items()
                 }
-                for row in results
-            ][
-                :MAX_NUM_ROWS
-            ]  # Convert BigQuery RowIterator to list of dicts
+                for row in itertools.islice(results, MAX_NUM_ROWS)
+            ]
             # return f"Valid SQL. Results: {rows}"
             final_result["query_result"] = rows
 
@@ -308,6 +540,7 @@ def run_bigquery_validation(
     ) as e:  # Catch generic exceptions from BigQuery  # pylint: disable=broad-exception-caught
         final_result["error_message"] = f"Invalid SQL: {e}"
 
-    print("\n run_bigquery_validation final_result: \n", final_result)
+    # The result rows are only formatted when debug logging is enabled.
+    logging.debug("run_bigquery_validation final_result: %s", final_result)
 
     return final_result
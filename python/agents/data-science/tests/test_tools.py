@@ -0,0 +1,291 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test cases for the database agent tools."""
+
+import datetime
+import decimal
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.cloud import bigquery
+
+from data_science.sub_agents.bigquery import tools
+
+
+class StubClient:
+    """A BigQuery client stub that serves one table and counts requests."""
+
+    def __init__(self):
+        self.get_table_calls = 0
+        self.list_rows_calls = 0
+
+    def list_tables(self, dataset_ref):
+        return [types.SimpleNamespace(table_id="t")]
+
+    def get_table(self, table_ref):
+        self.get_table_calls += 1
+        return types.SimpleNamespace(
+            reference=table_ref,
+            table_type="TABLE",
+            schema=[bigquery.SchemaField("a", "INTEGER")],
+            num_rows=1,
+            streaming_buffer=None,
+        )
+
+    def list_rows(self, table_obj, max_results=None):
+        self.list_rows_calls += 1
+        return [{"a": 1}]
+
+
+class TestDmlDdlCheck(unittest.TestCase):
+    """Test cases for the DML/DDL check in front of query execution."""
+
+    def test_allows_identifiers_containing_keywords(self):
+        self.assertFalse(tools._contains_dml_ddl("SELECT created_at FROM t"))
+
+    def test_rejects_statement_after_select(self):
+        self.assertTrue(tools._contains_dml_ddl("select 1; DROP TABLE x"))
+
+    def test_rejects_backquoted_keyword(self):
+        self.assertTrue(tools._contains_dml_ddl("SELECT `update` FROM t"))
+
+    def test_allows_keyword_prefix(self):
+        self.assertFalse(tools._contains_dml_ddl("SELECT drop1 FROM t"))
+
+
+class TestCleanupSql(unittest.TestCase):
+    """Test cases for the cleanup of generated SQL before validation."""
+
+    def test_unescapes_quotes_and_newlines(self):
+        sql_string = "SELECT \\\"a\\\", \\'b\\'\\nFROM t\\\nLIMIT 5"
+        self.assertEqual(
+            tools.cleanup_sql(sql_string), "SELECT \"a\", 'b'\nFROM t\nLIMIT 5"
+        )
+
+    def test_keeps_existing_limit(self):
+        self.assertEqual(
+            tools.cleanup_sql("SELECT a FROM t Limit 5"), "SELECT a FROM t Limit 5"
+        )
+
+    def test_adds_limit_when_missing(self):
+        self.assertEqual(
+            tools.cleanup_sql("SELECT a FROM t"),
+            f"SELECT a FROM t limit {tools.MAX_NUM_ROWS}",
+        )
+
+    def test_adds_limit_despite_limit_in_identifier(self):
+        self.assertEqual(
+            tools.cleanup_sql("SELECT speed_limit FROM t"),
+            f"SELECT speed_limit FROM t limit {tools.MAX_NUM_ROWS}",
+        )
+
+
+class TestSerializeValueForSql(unittest.TestCase):
+    """Test cases for rendering sample values as BigQuery SQL literals."""
+
+    def test_null(self):
+        self.assertEqual(tools._serialize_value_for_sql(None), "NULL")
+
+    def test_scalars(self):
+        self.assertEqual(tools._serialize_value_for_sql(42), "42")
+        self.assertEqual(tools._serialize_value_for_sql(1.5), "1.5")
+        self.assertEqual(tools._serialize_value_for_sql(True), "True")
+        self.assertEqual(
+            tools._serialize_value_for_sql(decimal.Decimal("12.30")), "12.30"
+        )
+
+    def test_string_is_escaped(self):
+        self.assertEqual(
+            tools._serialize_value_for_sql("it's a\\b\nc"), "'it\\'s a\\\\b\\nc'"
+        )
+
+    def test_bytes(self):
+        self.assertEqual(tools._serialize_value_for_sql(b"ab"), "FROM_BASE64('YWI=')")
+
+    def test_temporals_are_quoted(self):
+        self.assertEqual(
+            tools._serialize_value_for_sql(datetime.date(2024, 1, 2)), "'2024-01-02'"
+        )
+        self.assertEqual(
+            tools._serialize_value_for_sql(
+                datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+            ),
+            "'2024-01-02 03:04:05+00:00'",
+        )
+        self.assertEqual(
+            tools._serialize_value_for_sql(datetime.time(3, 4, 5)), "'03:04:05'"
+        )
+
+    def test_array(self):
+        self.assertEqual(
+            tools._serialize_value_for_sql([1, None, "x"]), "[1, NULL, 'x']"
+        )
+
+    def test_struct(self):
+        self.assertEqual(
+            tools._serialize_value_for_sql({"a": 1, "b": ["x"]}),
+            "STRUCT(1 AS `a`, ['x'] AS `b`)",
+        )
+
+    def test_subclass_falls_back_to_isinstance(self):
+        class Label(str):
+            pass
+
+        self.assertEqual(tools._serialize_value_for_sql(Label("x")), "'x'")
+
+
+class TestBuildSchemaDdl(unittest.TestCase):
+    """Test cases for the DDL generated from table metadata and sample rows."""
+
+    def test_golden_output(self):
+        tables = [
+            types.SimpleNamespace(
+                reference=bigquery.TableReference.from_string("p.d.t"),
+                schema=[
+                    bigquery.SchemaField("id", "INTEGER", description="it's the key"),
+                    bigquery.SchemaField("tags", "STRING", mode="REPEATED"),
+                ],
+            ),
+            types.SimpleNamespace(
+                reference=bigquery.TableReference.from_string("p.d.u"),
+                schema=[bigquery.SchemaField("name", "STRING")],
+            ),
+        ]
+        samples = [[{"id": 1, "tags": ["a", "b"]}, {"id": 2, "tags": []}], []]
+        self.assertEqual(
+            tools._build_schema_ddl(tables, samples),
+            "CREATE OR REPLACE TABLE `p.d.t` (\n"
+            "  `id` INTEGER COMMENT 'it\\'s the key',\n"
+            "  `tags` STRING ARRAY\n"
+            ");\n\n"
+            "-- Example values for table `p.d.t`:\n"
+            "INSERT INTO `p.d.t` VALUES\n"
+            "(1, ['a', 'b']);\n\n"
+            "INSERT INTO `p.d.t` VALUES\n"
+            "(2, []);\n\n"
+            "CREATE OR REPLACE TABLE `p.d.u` (\n"
+            "  `name` STRING\n"
+            ");\n\n",
+        )
+
+
+class TestSchemaCaching(unittest.TestCase):
+    """Test cases for the caching of table metadata and sample rows."""
+
+    def setUp(self):
+        tools.clear_schema_caches()
+        self.client = StubClient()
+
+    def tearDown(self):
+        tools.clear_schema_caches()
+
+    def test_get_bigquery_schema_reuses_cached_tables(self):
+        ddl = tools.get_bigquery_schema("d", client=self.client, project_id="p")
+        self.assertEqual(
+            tools.get_bigquery_schema("d", client=self.client, project_id="p"), ddl
+        )
+        self.assertEqual(self.client.get_table_calls, 1)
+        self.assertEqual(self.client.list_rows_calls, 1)
+
+    def test_update_database_settings_refreshes(self):
+        env = {"BQ_PROJECT_ID": "p", "BQ_DATASET_ID": "d"}
+        with mock.patch.dict(os.environ, env), mock.patch.object(
+            tools, "bq_client", self.client
+        ), mock.patch.object(tools, "database_settings", None):
+            tools._get_env_var_once.cache_clear()
+            tools.update_database_settings()
+            tools.update_database_settings()
+        tools._get_env_var_once.cache_clear()
+        self.assertEqual(self.client.get_table_calls, 2)
+        self.assertEqual(self.client.list_rows_calls, 2)
+
+
+class TestTableSampleRows(unittest.TestCase):
+    """Test cases for skipping the sample rows of empty tables."""
+
+    def setUp(self):
+        tools.clear_schema_caches()
+        self.client = StubClient()
+
+    def tearDown(self):
+        tools.clear_schema_caches()
+
+    def _table(self, num_rows, streaming_buffer=None):
+        return types.SimpleNamespace(
+            reference=bigquery.TableReference.from_string("p.d.t"),
+            num_rows=num_rows,
+            streaming_buffer=streaming_buffer,
+        )
+
+    def test_skips_empty_table(self):
+        self.assertIsNone(tools._get_table_sample_rows(self.client, self._table(0)))
+        self.assertEqual(self.client.list_rows_calls, 0)
+
+    def test_samples_table_with_streaming_buffer(self):
+        table_obj = self._table(0, streaming_buffer=object())
+        self.assertEqual(
+            tools._get_table_sample_rows(self.client, table_obj), [{"a": 1}]
+        )
+        self.assertEqual(self.client.list_rows_calls, 1)
+
+    def test_samples_table_with_unknown_row_count(self):
+        self.assertEqual(
+            tools._get_table_sample_rows(self.client, self._table(None)), [{"a": 1}]
+        )
+        self.assertEqual(self.client.list_rows_calls, 1)
+
+
+class TestStripCodeFences(unittest.TestCase):
+    """Test cases for extracting SQL from the model response."""
+
+    def test_plain_fence(self):
+        self.assertEqual(
+            tools._strip_code_fences("```sql\nSELECT 1\nFROM t\n```\n"),
+            "SELECT 1\nFROM t",
+        )
+
+    def test_uppercase_fence(self):
+        self.assertEqual(tools._strip_code_fences("```SQL\nSELECT 1\n```"), "SELECT 1")
+
+    def test_inline_fence(self):
+        self.assertEqual(
+            tools._strip_code_fences("Here: ```sql SELECT 1```"), "SELECT 1"
+        )
+
+    def test_no_fence(self):
+        self.assertEqual(tools._strip_code_fences("  SELECT 1  \n"), "SELECT 1")
+
+
+class TestNl2SqlPrompt(unittest.TestCase):
+    """Test cases for the NL2SQL prompt construction."""
+
+    def test_matches_format_with_placeholders_in_schema(self):
+        ddl_schema = "CREATE TABLE t (`a` STRING COMMENT '{QUESTION} {SCHEMA}');"
+        question = "How many rows are there in {SCHEMA}?"
+        self.assertEqual(
+            tools._build_nl2sql_prompt(ddl_schema, question),
+            tools.NL2SQL_PROMPT_TEMPLATE.format(
+                MAX_NUM_ROWS=tools.MAX_NUM_ROWS, SCHEMA=ddl_schema, QUESTION=question
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()